@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import difflib
 import hashlib
 import json
+import os
 import re
 import secrets
 import time
@@ -11,7 +13,13 @@ from typing import Any, Dict, Optional
 from aqt import gui_hooks, mw
 from aqt.utils import tooltip
 
-from .gpt_client import judge_text  # GPTError не использовался — убрал импорт
+from .executor import LANE_BULK, LANE_FOREGROUND, LANE_SPECULATIVE, GradingExecutor
+from .gold import DEFAULT_SEPARATORS, clean_gold
+from .gpt_client import (  # GPTError не использовался — убрал импорт
+    explain_text,
+    judge_text,
+)
+from .local_grader import LocalGrader
 from .logic import get_cfg, map_to_ease
 
 # ---------------- LRU-кеш ----------------
@@ -19,9 +27,30 @@ CACHE: "OrderedDict[str, tuple]" = OrderedDict()
 CACHE_MAX = 500
 _SALT = secrets.token_bytes(16)
 
+# ---------------- Мемо очищенного эталона ----------------
+# ключ: (note id, note mod, поле, разделители) — каждая карточка чистится один раз
+GOLD_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+GOLD_CACHE_MAX = 2000
+
+# ---------------- Пул грейдинга ----------------
+# свой пул вместо общего mw.taskman: карточка на экране не ждёт чужие задачи
+EXECUTOR: Optional[GradingExecutor] = None
+# ответов GPT с момента запуска: каждый grader_stats_every-й — снимок метрик пула в лог
+RESPONSES_SEEN = 0
+
+# ---------------- Двухфазный режим ----------------
+# последний вердикт без объяснения: по запросу дозапрашиваем комментарий
+LAST_VERDICT: Optional[dict] = None
+
 LAST_REQUEST_TS = 0.0
 HOOKS_ATTACHED = False  # защита от двойного навешивания хуков
 
+# ---------------- Локальный грейдер ----------------
+# веса лежат в user_files, чтобы переживать обновления аддона
+GRADER = LocalGrader(
+    path=os.path.join(os.path.dirname(__file__), "user_files", "local_grader.json")
+)
+
 _ws_re = re.compile(r"\s+")
 _p_space = re.compile(r"\s+([,.:;!?])")
 
@@ -41,6 +70,46 @@ def _get_field(note, name: str) -> str:
         return ""
 
 
+def _get_gold(note, cfg: dict) -> tuple:
+    """
+    Эталон без разметки и медиа, разбитый на допустимые варианты:
+    (варианты, нормализованные варианты). Мемоизируется по (note id, mod).
+    """
+    field = cfg["fields"]["etalon_field"]
+    seps = tuple(cfg.get("gold_separators", DEFAULT_SEPARATORS) or ())
+    nid, mod = getattr(note, "id", None), getattr(note, "mod", None)
+    key = (nid, mod, field, seps)
+    hit = GOLD_CACHE.get(key)
+    if hit is not None:
+        GOLD_CACHE.move_to_end(key)
+        return hit
+
+    alts = clean_gold(_get_field(note, field), seps)
+    value = (tuple(alts), tuple(_norm(a) for a in alts))
+    if nid is not None and mod is not None:
+        GOLD_CACHE[key] = value
+        while len(GOLD_CACHE) > GOLD_CACHE_MAX:
+            GOLD_CACHE.popitem(last=False)
+    return value
+
+
+def _closest_gold(user_norm: str, golds_norm: tuple) -> str:
+    """
+    Вариант эталона, ближайший к ответу (для локального грейдера).
+    Считается в UI-потоке, поэтому сравниваем только то, что грейдер
+    всё равно примет по длине.
+    """
+    candidates = [g for g in golds_norm if GRADER.accepts(user_norm, g)]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else golds_norm[0]
+    return max(
+        candidates,
+        key=lambda g: difflib.SequenceMatcher(
+            None, user_norm, g, autojunk=False
+        ).ratio(),
+    )
+
+
 def _cache_key(user: str, gold: str, model: str = "") -> str:
     # соль, чтобы по ключу нельзя было догадаться о содержимом
     h = hashlib.sha256()
@@ -77,6 +146,18 @@ def _cache_put(k: str, payload, now: float) -> None:
         CACHE.popitem(last=False)
 
 
+def _panel_comment(cfg: dict, verdict: dict) -> str:
+    """
+    Текст для панели карточки. Категория вместо комментария — только в полной
+    схеме: в компактной и двухфазной комментарий необязателен (у Easy его нет),
+    и подставленная категория выглядела бы как замечание к верному ответу.
+    """
+    comment = (verdict.get("comment") or "").strip()
+    if comment or cfg.get("compact_verdict", True) or cfg.get("two_phase", False):
+        return comment
+    return (verdict.get("category") or "").strip()
+
+
 def _tooltip_from_verdict(verdict: dict) -> str:
     """
     "<Category> — <Comment> → <Button>"
@@ -107,6 +188,150 @@ def _ease_from_verdict(verdict: dict) -> int:
     return {"again": 1, "hard": 2, "good": 3, "easy": 4}.get(btn, 0)
 
 
+def _local_verdict(pred: dict) -> dict:
+    """Прогноз локального грейдера в формате вердикта GPT."""
+    return {
+        "category": "",
+        "button": pred["button"],
+        "comment": "",
+        "confidence": pred["confidence"],
+        "source": "local",
+    }
+
+
+def _grader_trusted(cfg: dict, pred: Optional[dict]) -> bool:
+    return GRADER.is_trusted(
+        pred,
+        min_confidence=float(cfg.get("local_grader_min_confidence", 0.9)),
+        min_samples=int(cfg.get("local_grader_min_samples", 200)),
+        min_precision=float(cfg.get("local_grader_min_precision", 0.95)),
+    )
+
+
+def _get_executor(cfg: dict) -> GradingExecutor:
+    global EXECUTOR
+    if EXECUTOR is None:
+        EXECUTOR = GradingExecutor(
+            workers=int(cfg.get("grader_workers", 2)),
+            max_queue=int(cfg.get("grader_queue_max", 64)),
+        )
+    return EXECUTOR
+
+
+def _run_graded(cfg: dict, work, on_done, lane: int = LANE_FOREGROUND):
+    """
+    Запуск задачи в пуле грейдинга; on_done(fut) выполняется в главном потоке.
+    """
+
+    def to_main(fut):
+        # вытесненные задачи (карточка уже ушла с экрана) молча пропускаем
+        if not fut.cancelled():
+            mw.taskman.run_on_main(lambda: on_done(fut))
+
+    return _get_executor(cfg).submit(work, lane=lane, on_done=to_main)
+
+
+def _learn_in_background(
+    cfg: dict, user_norm: str, gold_norm: str, button: str
+) -> None:
+    """Инкрементально дообучаем локальный грейдер в полосе массовых задач."""
+    try:
+        _get_executor(cfg).submit(
+            lambda: GRADER.learn(user_norm, gold_norm, button), lane=LANE_BULK
+        )
+    except Exception:
+        pass
+
+
+def _remember_verdict(
+    card_id, user_text: str, gold_text: str, api_key: str, verdict: dict
+) -> None:
+    global LAST_VERDICT
+    LAST_VERDICT = {
+        "card_id": card_id,
+        "user_text": user_text,
+        "gold_text": gold_text,
+        "api_key": api_key,
+        "verdict": verdict,
+        "pending": False,
+    }
+
+
+def _request_explanation(cfg: dict, lane: int) -> None:
+    """
+    Вторая фаза: объяснение последнего вердикта. Тот же prompt, что у первой
+    фазы, поэтому префикс попадает в кеш провайдера. Комментарий дописывается
+    в сам вердикт (а значит, и в кеш).
+    """
+    ctx = LAST_VERDICT
+    if not ctx or ctx["pending"]:
+        return
+    verdict = ctx["verdict"]
+    ease = _ease_from_verdict(verdict)
+    if (verdict.get("comment") or "").strip():
+        _push_ui_advice(ease=ease, comment=verdict["comment"])
+        return
+    ctx["pending"] = True
+
+    def work():
+        return explain_text(
+            user_text=ctx["user_text"],
+            gold_text=ctx["gold_text"],
+            verdict=verdict,
+            api_key=ctx["api_key"],
+        )
+
+    def on_done(fut):
+        ctx["pending"] = False
+        try:
+            res = fut.result()  # {comment, usage, latency_ms}
+        except Exception as e:
+            _log_to_card(
+                {"kind": "error", "message": str(e), "ts": int(time.time() * 1000)}
+            )
+            return
+        verdict["comment"] = res["comment"]
+        usage = res.get("usage") or {}
+        _log_to_card(
+            {
+                "kind": "explain",
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "total_tokens": usage.get("total_tokens"),
+                "cached_tokens": usage.get("cached_tokens"),
+                "latency_ms": res.get("latency_ms"),
+                "ts": int(time.time() * 1000),
+            }
+        )
+        # карточка могла смениться (авто-ответ) — тогда только всплывашка
+        cur = getattr(mw.reviewer, "card", None)
+        if cur and cur.id == ctx["card_id"]:
+            _push_ui_advice(ease=ease, comment=res["comment"])
+        else:
+            tooltip(f"GPT: {_tooltip_from_verdict(verdict)}")
+
+    def on_cancelled(fut):
+        # вытесненную или отменённую при закрытии профиля задачу on_done не увидит
+        if fut.cancelled():
+            ctx["pending"] = False
+
+    try:
+        _run_graded(cfg, work, on_done, lane=lane).add_done_callback(on_cancelled)
+    except Exception:
+        ctx["pending"] = False
+
+
+def _after_verdict(
+    cfg: dict, card_id, user_text: str, gold_text: str, api_key: str, verdict: dict
+) -> None:
+    """В двухфазном режиме: запоминаем вердикт и для плохих ответов сразу просим объяснение."""
+    if not cfg.get("two_phase", False):
+        return
+    _remember_verdict(card_id, user_text, gold_text, api_key, verdict)
+    if verdict.get("button") in cfg.get("explain_auto_buttons", ["Again", "Hard"]):
+        _request_explanation(cfg, LANE_SPECULATIVE)
+
+
 def _try_answer(ease: int) -> None:
     """Безопасно нажимаем кнопку повтора (API у Anki менялся)."""
     try:
@@ -161,6 +386,14 @@ def _log_to_card(event: dict) -> None:
 
 # ---------------- Основной обработчик ----------------
 def on_js_message(handled, message, context):
+    # объяснение по запросу (клик по панели GPT): "explain:{...}"
+    # идёт в спекулятивную полосу — зарезервированные потоки остаются за оценкой
+    if isinstance(message, str) and message.startswith("explain:"):
+        card = getattr(mw.reviewer, "card", None)
+        if card and LAST_VERDICT and LAST_VERDICT["card_id"] == card.id:
+            _request_explanation(get_cfg(), LANE_SPECULATIVE)
+        return (True, None)
+
     # ожидаем строку вида "judge:{...json...}"
     if not isinstance(message, str) or not message.startswith("judge:"):
         return handled
@@ -185,18 +418,20 @@ def on_js_message(handled, message, context):
         return (True, None)
 
     note = card.note()
-    gold = _get_field(note, cfg["fields"]["etalon_field"])
+    golds, golds_norm = _get_gold(note, cfg)
     user_text = (payload.get("text") or "").strip()
-    if not user_text or not gold:
+    if not user_text or not golds:
         if not user_text:
             _push_ui_advice(comment="Пустой ответ")
         return (True, None)
 
     user_norm = _norm(user_text)
-    gold_norm = _norm(gold)
+    gold_norm = _closest_gold(user_norm, golds_norm)
+    # в промпт идут все допустимые варианты
+    gold = " | ".join(golds)
 
-    # быстрый путь: точное совпадение
-    if user_norm == gold_norm and gold_norm:
+    # быстрый путь: точное совпадение с любым из вариантов
+    if user_norm in golds_norm:
         ease = 4
         tooltip("Exact match → Easy")
         _push_ui_advice(ease=ease, comment="Точное совпадение")
@@ -211,10 +446,17 @@ def on_js_message(handled, message, context):
         return (True, None)
     LAST_REQUEST_TS = now
 
+    # ровно то, что уйдёт в prompt (вторая фаза должна повторить его байт в байт)
+    prompt_user = user_text[: cfg.get("max_input_len", 800)]
+    prompt_gold = gold[: cfg.get("max_gold_len", 800)]
+    two_phase = bool(cfg.get("two_phase", False))
+
     # кэш
     cache_ttl = int(cfg.get("cache_ttl_sec", 600))
     model = (cfg.get("model") or "gpt-4o-mini").strip()
-    ckey = _cache_key(user_norm, gold_norm, model)
+    ckey = _cache_key(
+        user_norm, "\0".join(golds_norm), model + ("/2p" if two_phase else "")
+    )
     if cache_ttl > 0:
         cached = _cache_get(ckey, now, cache_ttl)
         if cached:
@@ -222,9 +464,36 @@ def on_js_message(handled, message, context):
             tooltip(f"GPT(кеш): {_tooltip_from_verdict(cached)}")
             _push_ui_advice(
                 ease=ease,
-                comment=(cached.get("comment") or cached.get("category") or "").strip(),
+                comment=_panel_comment(cfg, cached),
                 confidence=cached.get("confidence"),
             )
+            _after_verdict(cfg, card.id, prompt_user, prompt_gold, api_key, cached)
+            if cfg.get("auto_answer", True) and ease in (1, 2, 3, 4):
+                _try_answer(ease)
+            return (True, None)
+
+    # локальный пред-этап: уверенные случаи отвечаем без похода в модель,
+    # кроме выборочных проверок — их вердикт GPT пополнит окно точности
+    use_local = bool(cfg.get("local_grader", True))
+    audit = False
+    if use_local:
+        pred = GRADER.predict(user_norm, gold_norm)
+        trusted = _grader_trusted(cfg, pred)
+        if trusted:
+            audit = GRADER.audit_due(int(cfg.get("local_grader_audit_every", 10)))
+        if trusted and not audit:
+            local = _local_verdict(pred)
+            ease = _ease_from_verdict(local)
+            tooltip(f"Локально: {_tooltip_from_verdict(local)}")
+            _push_ui_advice(ease=ease, confidence=local["confidence"])
+            _log_to_card(
+                {
+                    "kind": "local",
+                    "button": local["button"],
+                    "confidence": round(local["confidence"], 3),
+                    "ts": int(time.time() * 1000),
+                }
+            )
             if cfg.get("auto_answer", True) and ease in (1, 2, 3, 4):
                 _try_answer(ease)
             return (True, None)
@@ -232,10 +501,12 @@ def on_js_message(handled, message, context):
     requested_card_id = card.id
 
     def work():
+        # двухфазный режим: сначала только кнопка и категория, объяснение — потом
         return judge_text(
-            user_text=user_text[: cfg.get("max_input_len", 800)],
-            gold_text=gold[: cfg.get("max_gold_len", 800)],
+            user_text=prompt_user,
+            gold_text=prompt_gold,
             api_key=api_key,
+            button_only=two_phase,
         )
 
     # лог: запрос
@@ -244,6 +515,8 @@ def on_js_message(handled, message, context):
             "kind": "request",
             "model": model,
             "text_len": len(user_text),
+            "audit": audit,
+            "queue_depth": _get_executor(cfg).depth(),
             "ts": int(time.time() * 1000),
         }
     )
@@ -258,8 +531,6 @@ def on_js_message(handled, message, context):
                 fut.result()
             )  # {category, button, comment, ease, confidence?, usage?, cost_usd?, balance_usd?}
         except Exception as e:
-            tooltip(f"GPT error: {e}")
-            _push_ui_advice(comment=f"GPT error: {e}")
             _log_to_card(
                 {
                     "kind": "error",
@@ -268,18 +539,46 @@ def on_js_message(handled, message, context):
                     "ts": int(time.time() * 1000),
                 }
             )
+            # деградированный режим: отвечает локальный грейдер,
+            # но только если он уже обучен на достаточном числе вердиктов
+            min_samples = int(cfg.get("local_grader_min_samples", 200))
+            pred = None
+            if use_local and GRADER.samples >= min_samples:
+                pred = GRADER.predict(user_norm, gold_norm)
+            if not pred:
+                tooltip(f"GPT error: {e}")
+                _push_ui_advice(comment=f"GPT error: {e}")
+                return
+            local = _local_verdict(pred)
+            ease = _ease_from_verdict(local)
+            tooltip(f"GPT недоступен, локально: {_tooltip_from_verdict(local)}")
+            _push_ui_advice(
+                ease=ease,
+                comment="GPT недоступен — локальная оценка",
+                confidence=local["confidence"],
+            )
+            # авто-ответ только для прогнозов, которым модель уже заслужила доверие
+            if (
+                cfg.get("auto_answer", True)
+                and ease in (1, 2, 3, 4)
+                and _grader_trusted(cfg, pred)
+            ):
+                _try_answer(ease)
             return
 
         if cache_ttl > 0:
             _cache_put(ckey, verdict, time.time())
 
+        if use_local:
+            _learn_in_background(cfg, user_norm, gold_norm, verdict.get("button") or "")
+
         ease = _ease_from_verdict(verdict)
         tooltip(f"GPT: {_tooltip_from_verdict(verdict)}")
 
         # UI карточки
         _push_ui_advice(
             ease=ease,
-            comment=(verdict.get("comment") or verdict.get("category") or "").strip(),
+            comment=_panel_comment(cfg, verdict),
             confidence=verdict.get("confidence"),
         )
 
@@ -292,24 +591,62 @@ def on_js_message(handled, message, context):
                 "prompt_tokens": usage.get("prompt_tokens"),
                 "completion_tokens": usage.get("completion_tokens"),
                 "total_tokens": usage.get("total_tokens"),
+                "cached_tokens": usage.get("cached_tokens"),
+                "latency_ms": verdict.get("latency_ms"),
+                "cached": bool(verdict.get("cached")),
                 "cost_usd": verdict.get("cost_usd"),
                 "balance_usd": verdict.get("balance_usd"),
+                "queue_wait_ms": round(getattr(fut, "queue_wait_ms", 0.0), 1),
                 "ts": int(time.time() * 1000),
             }
         )
+        _log_grading_stats(cfg)
+
+        _after_verdict(
+            cfg, requested_card_id, prompt_user, prompt_gold, api_key, verdict
+        )
 
         # авто-ответ
         if cfg.get("auto_answer", True) and ease in (1, 2, 3, 4):
             _try_answer(ease)
 
     try:
-        mw.taskman.run_in_background(work, on_done)
+        _run_graded(cfg, work, on_done)
     except Exception as e:
         tooltip(f"Ошибка запуска фоновой задачи: {e}")
 
     return (True, None)
 
 
+def on_profile_will_close():
+    global EXECUTOR
+    # сохраняем накопленное обучение локального грейдера
+    GRADER.save()
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown()
+        EXECUTOR = None
+
+
+def grading_stats() -> dict:
+    """Метрики пула грейдинга: глубина очередей и время ожидания по полосам."""
+    return EXECUTOR.stats() if EXECUTOR is not None else {}
+
+
+def _log_grading_stats(cfg: dict) -> None:
+    """Периодически кладём в лог карточки метрики пула по полосам."""
+    global RESPONSES_SEEN
+    RESPONSES_SEEN += 1
+    every = int(cfg.get("grader_stats_every", 20))
+    if every > 0 and RESPONSES_SEEN % every == 0:
+        _log_to_card(
+            {
+                "kind": "queue_stats",
+                "lanes": grading_stats(),
+                "ts": int(time.time() * 1000),
+            }
+        )
+
+
 def on_profile_loaded():
     global HOOKS_ATTACHED
     cfg = get_cfg()
@@ -323,3 +660,4 @@ def on_profile_loaded():
 
 
 gui_hooks.profile_did_open.append(on_profile_loaded)
+gui_hooks.profile_will_close.append(on_profile_will_close)
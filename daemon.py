@@ -0,0 +1,267 @@
+# daemon.py
+# Долгоживущий локальный демон грейдинга: один тёплый клиент SDK, снимок конфига
+# и общий кеш вердиктов для аддона, CLI (gpt_client.py) и скриптов.
+# Протокол: TCP на localhost, одна строка JSON на запрос и одна на ответ.
+# Каждый запрос несёт "token" — секрет из user_files/daemon.token, который демон
+# создаёт при запуске (права 0600). Первая же строка не-JSON или с чужим токеном
+# закрывает соединение: так браузерный fetch на localhost ничего не добьётся.
+#   -> {"op": "judge", "user_text": ..., "gold_text": ..., "api_key"?, "compact"?,
+#       "button_only"?, "overrides"?}  (overrides — только DAEMON_OVERRIDE_KEYS)
+#   -> {"op": "explain", "user_text": ..., "gold_text": ..., "verdict": {...}, "api_key"?}
+#   -> {"op": "ping"} / {"op": "stats"}
+#   <- {"ok": true, "result": {...}} | {"ok": false, "error": "..."}
+# Запуск: python daemon.py [--host 127.0.0.1] [--port 8765]
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from . import gpt_client
+except ImportError:  # запуск скриптом из каталога аддона
+    import gpt_client  # type: ignore[no-redef]
+
+MAX_LINE = 1 << 20  # защита от гигантских запросов
+
+
+class GradingDaemon:
+    def __init__(self, workers: int = 8, cache_max: int = 5000) -> None:
+        # блокирующие вызовы SDK уходят в пул; клиенты тёплые (кешируются в gpt_client)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.cache_max = cache_max
+        # одинаковые одновременные запросы ждут один и тот же поход в модель
+        self.inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.started = time.time()
+        self.token = secrets.token_hex(32)
+        self.stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "rejected": 0,
+        }
+
+    # ---------- кеш ----------
+    @staticmethod
+    def _key(cfg: Dict[str, Any], req: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        for part in (
+            str(cfg.get("model", "")),
+            str(req.get("compact")),
+            str(bool(req.get("button_only"))),
+            json.dumps(req.get("overrides") or {}, sort_keys=True),
+            str(req.get("user_text") or ""),
+            str(req.get("gold_text") or ""),
+        ):
+            h.update(part.encode("utf-8", "ignore"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _cache_get(self, k: str, ttl: int) -> Optional[Dict[str, Any]]:
+        v = self.cache.get(k)
+        if not v:
+            return None
+        ts, payload = v
+        if time.time() - ts >= ttl:
+            self.cache.pop(k, None)
+            return None
+        self.cache.move_to_end(k)
+        return payload
+
+    def _cache_put(self, k: str, payload: Dict[str, Any]) -> None:
+        self.cache[k] = (time.time(), payload)
+        self.cache.move_to_end(k)
+        while len(self.cache) > self.cache_max:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def _overrides(req: Dict[str, Any]) -> Dict[str, Any]:
+        """Переопределения конфига из запроса; base_url, ключи API и т.п. — отказ."""
+        overrides = req.get("overrides") or {}
+        if not isinstance(overrides, dict):
+            raise ValueError("overrides must be a JSON object")
+        denied = sorted(set(overrides) - gpt_client.DAEMON_OVERRIDE_KEYS)
+        if denied:
+            raise ValueError(f"overrides not allowed: {', '.join(denied)}")
+        return overrides
+
+    @staticmethod
+    def _reused(verdict: Dict[str, Any], t0: float) -> Dict[str, Any]:
+        """
+        Вердикт из кеша или чужого запроса: токены уже оплачены и учтены
+        первым получателем, поэтому usage пустой, а latency_ms — своя.
+        """
+        out = dict(verdict)
+        out["usage"] = {}
+        out["cached"] = True
+        out["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+        return out
+
+    # ---------- операции ----------
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, lambda: fn(*args, **kwargs))
+
+    async def judge(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        req = dict(req, overrides=self._overrides(req))
+        cfg = gpt_client.load_cfg()
+        ttl = int(cfg.get("cache_ttl_sec", 600))
+        k = self._key(cfg, req)
+        if ttl > 0:
+            cached = self._cache_get(k, ttl)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return self._reused(cached, t0)
+        if k in self.inflight:
+            self.stats["coalesced"] += 1
+            return self._reused(await asyncio.shield(self.inflight[k]), t0)
+
+        fut: "asyncio.Future[Dict[str, Any]]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self.inflight[k] = fut
+        try:
+            verdict = await self._run(
+                gpt_client.judge_text,
+                user_text=req.get("user_text") or "",
+                gold_text=req.get("gold_text") or "",
+                api_key=req.get("api_key"),
+                compact=req.get("compact"),
+                button_only=bool(req.get("button_only")),
+                use_daemon=False,  # не ходим сами к себе
+                overrides=req.get("overrides") or None,
+            )
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # помечаем как прочитанное, если никто не ждал
+            raise
+        finally:
+            self.inflight.pop(k, None)
+        if ttl > 0:
+            self._cache_put(k, verdict)
+        fut.set_result(verdict)
+        return verdict
+
+    async def explain(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._run(
+            gpt_client.explain_text,
+            user_text=req.get("user_text") or "",
+            gold_text=req.get("gold_text") or "",
+            verdict=req.get("verdict") or {},
+            api_key=req.get("api_key"),
+            use_daemon=False,
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pid": os.getpid(),
+            "uptime_sec": int(time.time() - self.started),
+            "cache_size": len(self.cache),
+            "inflight": len(self.inflight),
+        }
+
+    async def dispatch(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        if op == "judge":
+            return await self.judge(req)
+        if op == "explain":
+            return await self.explain(req)
+        if op in ("ping", "stats"):
+            return self.snapshot()
+        raise ValueError(f"unknown op: {op!r}")
+
+    # ---------- сеть ----------
+    def write_token(self) -> None:
+        """Секрет для клиентов: доступен только владельцу файла."""
+        path = gpt_client.daemon_token_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.token)
+        os.replace(tmp, path)
+
+    def _authorized(self, line: bytes) -> Optional[Dict[str, Any]]:
+        """Запрос, если строка — JSON-объект с верным токеном, иначе None."""
+        try:
+            req = json.loads(line.decode("utf-8"))
+        except ValueError:
+            return None
+        if not isinstance(req, dict):
+            return None
+        token = req.pop("token", None)
+        if not isinstance(token, str) or not secrets.compare_digest(
+            token.encode("utf-8"), self.token.encode("utf-8")
+        ):
+            return None
+        return req
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats["requests"] += 1
+                req = self._authorized(line)
+                if req is None:
+                    self.stats["rejected"] += 1
+                    break
+                try:
+                    reply = {"ok": True, "result": await self.dispatch(req)}
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    reply = {"ok": False, "error": str(e)}
+                writer.write(
+                    json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n"
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        self.write_token()
+        print(
+            f"gpt-judge daemon listening on {host}:{port} (pid {os.getpid()})",
+            flush=True,
+        )
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    cfg = gpt_client.load_cfg()
+    ap = argparse.ArgumentParser(description="Local GPT Judge grading daemon")
+    ap.add_argument("--host", default=str(cfg.get("daemon_host", "127.0.0.1")))
+    ap.add_argument("--port", type=int, default=int(cfg.get("daemon_port", 8765)))
+    ap.add_argument("--workers", type=int, default=int(cfg.get("daemon_workers", 8)))
+    args = ap.parse_args()
+
+    daemon = GradingDaemon(workers=args.workers)
+    try:
+        asyncio.run(daemon.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+# evaluate.py
+# Оценка «скорость vs качество» для нескольких конфигураций judge_text
+# на размеченном наборе (user, gold, ожидаемая кнопка).
+#
+# Набор — JSONL: {"user": "...", "gold": "...", "button": "Again|Hard|Good|Easy"}
+# Конфигурации — JSON-список: [{"name": "base"}, {"name": "short", "max_tokens": 24,
+#   "pad_min_tokens": 0}, {"name": "2p", "button_only": true}, ...]
+#   Любые ключи, кроме name/compact/button_only, идут в judge_text(overrides=...):
+#   model, max_tokens, pad_min_tokens, temperature, system_prompt, ...
+#
+# Запуск:
+#   python evaluate.py labeled.jsonl --configs configs.json [--concurrency 8]
+#   python evaluate.py labeled.jsonl --configs configs.json --stub   # без сети
+#   python evaluate.py ... --json report.json
+
+from __future__ import annotations
+
+import argparse
+import difflib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from . import gpt_client
+except ImportError:  # запуск скриптом из каталога аддона
+    import gpt_client  # type: ignore[no-redef]
+
+ALLOWED_BUTTONS = gpt_client.ALLOWED_BUTTONS
+ALLOWED_CATEGORIES = gpt_client.ALLOWED_CATEGORIES
+
+# ключи конфигурации, которые не являются ключами config.json
+_CALL_KEYS = ("name", "compact", "button_only")
+
+
+# =========================
+# Данные
+# =========================
+def load_items(path: str) -> List[Dict[str, str]]:
+    items: List[Dict[str, str]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            button = str(row.get("button") or "").strip().capitalize()
+            if button not in ALLOWED_BUTTONS:
+                raise ValueError(f"{path}:{n}: button must be one of {ALLOWED_BUTTONS}")
+            items.append(
+                {
+                    "user": str(row.get("user") or ""),
+                    "gold": str(row.get("gold") or ""),
+                    "button": button,
+                }
+            )
+    return items
+
+
+def load_configs(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return [{"name": "config.json"}]
+    with open(path, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    if not isinstance(configs, list) or not configs:
+        raise ValueError("configs file must be a non-empty JSON list")
+    for i, c in enumerate(configs):
+        c.setdefault("name", f"cfg{i}")
+    return configs
+
+
+# =========================
+# Локальная заглушка API
+# =========================
+_pad_re = re.compile(r"(?:\s*\[PAD\])+\s*$")
+
+
+def _stub_button(user: str, gold: str) -> Tuple[int, int]:
+    """Детерминированная «оценка» заглушки по похожести строк: (кнопка, категория)."""
+    u = " ".join(user.lower().split())
+    best = 0.0
+    for g in gold.split(" | "):
+        g = " ".join(g.lower().split())
+        if u == g:
+            return 3, ALLOWED_CATEGORIES.index("Vocabulary")
+        best = max(best, difflib.SequenceMatcher(None, u, g).ratio())
+    if best >= 0.9:
+        return 2, ALLOWED_CATEGORIES.index("Spelling")
+    if best >= 0.7:
+        return 1, ALLOWED_CATEGORIES.index("Tenses")
+    return 0, ALLOWED_CATEGORIES.index("Vocabulary")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Минимальный /v1/chat/completions с tool_calls в формате OpenAI.
+    Латентность ~ base + per_token * completion_tokens — как у настоящей генерации,
+    поэтому компактные схемы и малый max_tokens здесь тоже быстрее.
+    """
+
+    base_ms = 40.0
+    per_token_ms = 8.0
+
+    def log_message(self, *args: Any) -> None:  # тишина в консоли
+        pass
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        messages = body.get("messages") or []
+        tools = body.get("tools") or []
+        name = ((body.get("tool_choice") or {}).get("function") or {}).get("name", "")
+        max_tokens = int(body.get("max_tokens") or 64)
+
+        content = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        m = re.match(r"Reference \(Gold\): (.*)\nUser: (.*)", content, re.DOTALL)
+        gold, user = (m.group(1), _pad_re.sub("", m.group(2))) if m else ("", "")
+        b, c = _stub_button(user, gold)
+        comment = (
+            "Looks fine." if b == 3 else "Check the highlighted part of the sentence."
+        )
+
+        props: Dict[str, Any] = {}
+        for t in tools:
+            if t.get("function", {}).get("name") == name:
+                props = t["function"].get("parameters", {}).get("properties", {})
+        if name == "set_verdict":
+            args = {
+                "category": ALLOWED_CATEGORIES[c],
+                "button": ALLOWED_BUTTONS[b],
+                "comment": comment,
+            }
+        elif name == "x":
+            args = {"m": comment}
+        else:
+            args = {"b": b, "c": c}
+            if "m" in props and b != 3:
+                args["m"] = comment
+        arguments = json.dumps(args)
+
+        completion_tokens = int(ceil(len(arguments) / 4.0)) + 4
+        if completion_tokens > max_tokens:
+            # как у настоящей модели: обрезанный JSON
+            arguments = arguments[: max(0, (max_tokens - 4) * 4)]
+            completion_tokens = max_tokens
+        prompt_chars = sum(len(str(x.get("content") or "")) for x in messages)
+        prompt_chars += len(json.dumps(tools))
+        prompt_tokens = int(ceil(prompt_chars / 4.0))
+
+        time.sleep((self.base_ms + self.per_token_ms * completion_tokens) / 1000.0)
+
+        reply = {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "stub",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [
+                            {
+                                "id": "call_stub",
+                                "type": "function",
+                                "function": {"name": name, "arguments": arguments},
+                            }
+                        ],
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        data = json.dumps(reply).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub(
+    base_ms: float = 40.0, per_token_ms: float = 8.0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Поднимает заглушку на свободном порту; возвращает (сервер, base_url)."""
+    handler = type(
+        "StubHandler",
+        (_StubHandler,),
+        {"base_ms": base_ms, "per_token_ms": per_token_ms},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/"
+
+
+# =========================
+# Прогон и метрики
+# =========================
+def _run_one(config: Dict[str, Any], item: Dict[str, str]) -> Dict[str, Any]:
+    overrides = {k: v for k, v in config.items() if k not in _CALL_KEYS}
+    t0 = time.perf_counter()
+    try:
+        verdict = gpt_client.judge_text(
+            user_text=item["user"],
+            gold_text=item["gold"],
+            compact=config.get("compact"),
+            button_only=bool(config.get("button_only")),
+            use_daemon=False,  # демон и его кеш исказили бы замер
+            overrides=overrides,
+        )
+        error = None
+    except Exception as e:
+        # токены неудачных попыток judge_text прикладывает к исключению
+        verdict, error = {"usage": getattr(e, "usage", None)}, str(e)
+    return {
+        "button": verdict.get("button"),
+        "error": error,
+        "latency_ms": (time.perf_counter() - t0) * 1000.0,
+        "usage": verdict.get("usage") or {},
+    }
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(ceil(q * len(v))) - 1)], 1)
+
+
+def _summarize(
+    items: List[Dict[str, str]], results: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    ok = [(it, r) for it, r in zip(items, results) if r["error"] is None]
+    confusion = {e: {p: 0 for p in ALLOWED_BUTTONS} for e in ALLOWED_BUTTONS}
+    for it, r in ok:
+        confusion[it["button"]][r["button"]] += 1
+    hits = sum(1 for it, r in ok if r["button"] == it["button"])
+    lat = [r["latency_ms"] for r in results]
+
+    def tok(key: str) -> Optional[float]:
+        # по всем вызовам: неудачные тоже тратят токены
+        vals = [
+            r["usage"].get(key)
+            for r in results
+            if isinstance(r["usage"].get(key), int)
+        ]
+        return round(sum(vals) / len(vals), 1) if vals else None
+
+    return {
+        "n": len(results),
+        "errors": len(results) - len(ok),
+        # ошибки считаем промахами: конфигурация, которая падает, не «точная»
+        "accuracy": round(hits / len(results), 4) if results else None,
+        "latency_ms": {
+            "p50": _percentile(lat, 0.50),
+            "p90": _percentile(lat, 0.90),
+            "p99": _percentile(lat, 0.99),
+            "mean": round(sum(lat) / len(lat), 1) if lat else None,
+        },
+        "tokens_per_verdict": {
+            "prompt": tok("prompt_tokens"),
+            "completion": tok("completion_tokens"),
+            "cached": tok("cached_tokens"),
+        },
+        "confusion": confusion,
+    }
+
+
+def _agreement(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Доля совпавших кнопок по примерам, где обе конфигурации ответили,
+    и сколько таких примеров (n) — без него 1.000 по одному примеру не отличить.
+    """
+    pairs = [
+        (x["button"], y["button"])
+        for x, y in zip(a, b)
+        if not x["error"] and not y["error"]
+    ]
+    rate = sum(1 for x, y in pairs if x == y) / len(pairs) if pairs else None
+    return {"rate": round(rate, 4) if rate is not None else None, "n": len(pairs)}
+
+
+def evaluate(
+    items: List[Dict[str, str]], configs: List[Dict[str, Any]], concurrency: int = 8
+) -> Dict[str, Any]:
+    """
+    Прогоняет все конфигурации по всем примерам параллельно (задачи перемешаны,
+    чтобы конфигурации делили одинаковые условия сети) и собирает отчёт.
+    """
+    jobs = [(ci, ii) for ii in range(len(items)) for ci in range(len(configs))]
+    results: List[List[Optional[Dict[str, Any]]]] = [
+        [None] * len(items) for _ in configs
+    ]
+
+    def run(job: Tuple[int, int]) -> None:
+        ci, ii = job
+        results[ci][ii] = _run_one(configs[ci], items[ii])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        list(ex.map(run, jobs))
+
+    names = [c["name"] for c in configs]
+    done: List[List[Dict[str, Any]]] = [
+        [r for r in rs if r is not None] for rs in results
+    ]
+    return {
+        "items": len(items),
+        "configs": {name: _summarize(items, rs) for name, rs in zip(names, done)},
+        "agreement": {
+            a: {b: _agreement(done[i], done[j]) for j, b in enumerate(names)}
+            for i, a in enumerate(names)
+        },
+    }
+
+
+def pick_fastest(report: Dict[str, Any], max_accuracy_drop: float) -> Optional[str]:
+    """Самая быстрая (по p50) конфигурация, чья точность не хуже лучшей больше чем на max_accuracy_drop."""
+    rows = [(n, s) for n, s in report["configs"].items() if s["accuracy"] is not None]
+    if not rows:
+        return None
+    best = max(s["accuracy"] for _, s in rows)
+    ok = [
+        (s["latency_ms"]["p50"], n)
+        for n, s in rows
+        if s["accuracy"] >= best - max_accuracy_drop
+    ]
+    return min(ok)[1] if ok else None
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"items: {report['items']}", ""]
+    head = f"{'config':<20}{'acc':>8}{'err':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'in_tok':>9}{'out_tok':>9}"
+    lines.append(head)
+    lines.append("-" * len(head))
+    for name, s in report["configs"].items():
+        lat, tok = s["latency_ms"], s["tokens_per_verdict"]
+        lines.append(
+            f"{name[:19]:<20}{s['accuracy'] or 0:>8.3f}{s['errors']:>6}"
+            f"{lat['p50'] or 0:>9.0f}{lat['p90'] or 0:>9.0f}{lat['p99'] or 0:>9.0f}"
+            f"{tok['prompt'] or 0:>9.0f}{tok['completion'] or 0:>9.1f}"
+        )
+
+    for name, s in report["configs"].items():
+        lines += ["", f"confusion [{name}] (rows = expected, cols = predicted)"]
+        lines.append(" " * 8 + "".join(f"{b:>7}" for b in ALLOWED_BUTTONS))
+        for e in ALLOWED_BUTTONS:
+            lines.append(
+                f"{e:<8}"
+                + "".join(f"{s['confusion'][e][p]:>7}" for p in ALLOWED_BUTTONS)
+            )
+
+    names = list(report["configs"])
+    if len(names) > 1:
+        lines += ["", "agreement between configs (rate/n, n = items both answered)"]
+        lines.append(" " * 20 + "".join(f"{n[:11]:>12}" for n in names))
+        for a in names:
+            row = report["agreement"][a]
+            cells = [
+                (
+                    f"{row[b]['rate']:.3f}/{row[b]['n']}"
+                    if row[b]["rate"] is not None
+                    else f"—/{row[b]['n']}"
+                )
+                for b in names
+            ]
+            lines.append(f"{a[:19]:<20}" + "".join(f"{c:>12}" for c in cells))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Latency vs accuracy of judge_text configurations"
+    )
+    ap.add_argument("items", help="labeled JSONL: {user, gold, button}")
+    ap.add_argument(
+        "--configs", help="JSON list of configurations (default: config.json as is)"
+    )
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument(
+        "--stub",
+        action="store_true",
+        help="use a local stub endpoint instead of the real API",
+    )
+    ap.add_argument("--stub-base-ms", type=float, default=40.0)
+    ap.add_argument("--stub-per-token-ms", type=float, default=8.0)
+    ap.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    ap.add_argument(
+        "--json", dest="json_out", help="write the full report to this file"
+    )
+    args = ap.parse_args()
+
+    items = load_items(args.items)
+    configs = load_configs(args.configs)
+
+    server = None
+    if args.stub:
+        server, base_url = start_stub(args.stub_base_ms, args.stub_per_token_ms)
+        configs = [
+            {**c, "base_url": base_url, "openai_api_key": "stub"} for c in configs
+        ]
+
+    try:
+        report = evaluate(items, configs, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report["recommended"] = pick_fastest(report, args.max_accuracy_drop)
+    print(format_report(report))
+    print(
+        f"\nfastest within {args.max_accuracy_drop:.0%} of best accuracy: {report['recommended']}"
+    )
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
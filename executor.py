@@ -0,0 +1,177 @@
+# executor.py
+# Собственный пул потоков для грейдинга с приоритетными полосами.
+# mw.taskman.run_in_background — общий пул Anki (синхронизация, медиа, другие аддоны),
+# и вердикт для карточки на экране может стоять в очереди за чужой работой.
+# Здесь: ограниченные очереди, полосы по приоритету, метрики глубины и ожидания.
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Полосы: меньше — важнее
+LANE_FOREGROUND = 0  # карточка на экране
+LANE_SPECULATIVE = 1  # спекулятивные и prefetch-задачи
+LANE_BULK = 2  # массовые задачи (дообучение и т.п.)
+LANE_NAMES: List[str] = ["foreground", "speculative", "bulk"]
+
+_WAIT_WINDOW = 200  # сколько последних ожиданий держим для перцентилей
+# потоков только под foreground: карточка на экране и следующая (авто-ответ,
+# быстрый повтор) не ждут, пока общие потоки заняты фоновыми вызовами модели
+FOREGROUND_RESERVED = 2
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class GradingExecutor:
+    """
+    Пул: FOREGROUND_RESERVED потоков зарезервированы только под полосу
+    foreground, остальные `workers` берут задачи из всех полос строго по
+    приоритету. Поэтому оценка карточки на экране не ждёт фоновые задачи,
+    даже если одна foreground-задача уже выполняется.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 64) -> None:
+        self.max_queue = max(1, int(max_queue))
+        self._queues: List[Deque[Tuple[float, Future, Callable[[], Any]]]] = [
+            deque() for _ in LANE_NAMES
+        ]
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._stats = [
+            {"submitted": 0, "completed": 0, "rejected": 0, "dropped": 0}
+            for _ in LANE_NAMES
+        ]
+        self._waits: List[Deque[float]] = [
+            deque(maxlen=_WAIT_WINDOW) for _ in LANE_NAMES
+        ]
+        self._threads: List[threading.Thread] = []
+        for i in range(FOREGROUND_RESERVED):
+            self._spawn(lanes=(LANE_FOREGROUND,), name=f"gpt-judge-fg{i}")
+        for i in range(max(1, int(workers))):
+            self._spawn(lanes=tuple(range(len(LANE_NAMES))), name=f"gpt-judge-{i}")
+
+    def _spawn(self, lanes: Tuple[int, ...], name: str) -> None:
+        t = threading.Thread(target=self._worker, args=(lanes,), name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    # ---------- постановка задач ----------
+    def submit(
+        self,
+        fn: Callable[[], Any],
+        lane: int = LANE_FOREGROUND,
+        on_done: Optional[Callable[[Future], None]] = None,
+    ) -> Future:
+        """
+        Ставит fn в полосу lane. on_done(fut) вызывается из рабочего потока.
+        Переполнение foreground вытесняет самую старую ждущую задачу (её карточка
+        уже ушла с экрана), остальные полосы отказывают с QueueFullError.
+        """
+        fut: Future = Future()
+        if on_done is not None:
+            fut.add_done_callback(on_done)
+
+        dropped: Optional[Future] = None
+        with self._cond:
+            if self._shutdown:
+                rejected = RuntimeError("grading executor is shut down")
+            else:
+                q = self._queues[lane]
+                rejected = None
+                if len(q) >= self.max_queue:
+                    if lane == LANE_FOREGROUND:
+                        _, dropped, _ = q.popleft()
+                        self._stats[lane]["dropped"] += 1
+                    else:
+                        self._stats[lane]["rejected"] += 1
+                        rejected = QueueFullError(
+                            f"{LANE_NAMES[lane]} queue is full ({self.max_queue})"
+                        )
+                if rejected is None:
+                    q.append((time.monotonic(), fut, fn))
+                    self._stats[lane]["submitted"] += 1
+                    self._cond.notify_all()
+
+        if dropped is not None:
+            dropped.cancel()
+        if rejected is not None:
+            fut.set_exception(rejected)
+        return fut
+
+    # ---------- рабочие потоки ----------
+    def _take(self, lanes: Tuple[int, ...]):
+        for lane in lanes:
+            q = self._queues[lane]
+            if q:
+                return lane, q.popleft()
+        return None
+
+    def _worker(self, lanes: Tuple[int, ...]) -> None:
+        while True:
+            with self._cond:
+                item = self._take(lanes)
+                while item is None and not self._shutdown:
+                    self._cond.wait()
+                    item = self._take(lanes)
+                if item is None:
+                    return
+                lane, (enqueued, fut, fn) = item
+                wait_ms = (time.monotonic() - enqueued) * 1000.0
+                self._waits[lane].append(wait_ms)
+
+            if not fut.set_running_or_notify_cancel():
+                continue
+            fut.queue_wait_ms = wait_ms  # type: ignore[attr-defined]
+            try:
+                result = fn()
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+            with self._cond:
+                self._stats[lane]["completed"] += 1
+
+    # ---------- метрики ----------
+    def depth(self, lane: Optional[int] = None) -> int:
+        with self._cond:
+            if lane is not None:
+                return len(self._queues[lane])
+            return sum(len(q) for q in self._queues)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        По каждой полосе: глубина очереди, счётчики и время ожидания в очереди
+        (среднее, p95, максимум по последним задачам), в миллисекундах.
+        """
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._cond:
+            for lane, name in enumerate(LANE_NAMES):
+                waits = sorted(self._waits[lane])
+                row: Dict[str, Any] = dict(self._stats[lane])
+                row["depth"] = len(self._queues[lane])
+                if waits:
+                    row["wait_ms_avg"] = round(sum(waits) / len(waits), 2)
+                    # метод ближайшего ранга: ceil(0.95 * n)-й элемент по возрастанию
+                    i = min(len(waits) - 1, int(math.ceil(0.95 * len(waits))) - 1)
+                    row["wait_ms_p95"] = round(waits[i], 2)
+                    row["wait_ms_max"] = round(waits[-1], 2)
+                out[name] = row
+        return out
+
+    def shutdown(self) -> None:
+        """Останавливает потоки; ждущие задачи отменяются."""
+        with self._cond:
+            self._shutdown = True
+            pending = [fut for q in self._queues for _, fut, _ in q]
+            for q in self._queues:
+                q.clear()
+            self._cond.notify_all()
+        for fut in pending:
+            fut.cancel()
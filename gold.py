@@ -0,0 +1,65 @@
+# gold.py
+# Извлечение эталона из поля заметки: убираем HTML, сущности и медиа-теги,
+# делим поле на несколько допустимых ответов по разделителям из конфига.
+
+from __future__ import annotations
+
+import html
+import re
+from typing import Iterable, List
+
+# По умолчанию — только явный маркер вариантов: ";" и переносы строк
+# встречаются внутри обычных ответов. "\n" (а с ним <br> и блочные теги)
+# делит поле, только если пользователь сам добавил его в gold_separators.
+DEFAULT_SEPARATORS: List[str] = ["|"]
+
+# [sound:...] и маркеры [anki:tts ...]/[/anki:tts] убираем. Текст между маркерами
+# TTS остаётся частью эталона: это и есть ответ, который озвучивает карточка.
+_media_re = re.compile(r"\[(?:sound:|/?anki:[a-z_-]+)[^\]]*\]", re.IGNORECASE)
+_drop_block_re = re.compile(
+    r"<(script|style)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL
+)
+# переносы строк и блочные теги -> "\n" (граница вариантов, если "\n" в разделителях)
+_break_re = re.compile(r"<\s*(?:br|/?div|/?p|/?li|/?tr)\b[^>]*>", re.IGNORECASE)
+# строчные теги (<b>, <span>, ...) часто выделяют часть слова — удаляем без пробела
+_tag_re = re.compile(r"<[^>]+>")
+_ws_re = re.compile(r"[ \t\r\f\v\u00a0]+")
+
+
+def strip_markup(s: str) -> str:
+    """
+    HTML -> простой текст: без тегов, медиа ([sound:...], <img>) и сущностей (&nbsp; и т.п.).
+    Блочные теги и <br> превращаются в перевод строки, остальные теги
+    удаляются бесследно ("walk<b>ed</b>" -> "walked").
+    """
+    s = s or ""
+    s = _media_re.sub(" ", s)
+    s = _drop_block_re.sub(" ", s)
+    s = _break_re.sub("\n", s)
+    s = _tag_re.sub("", s)
+    s = html.unescape(s)
+    s = _ws_re.sub(" ", s)
+    return s.strip()
+
+
+def split_alternatives(s: str, separators: Iterable[str]) -> List[str]:
+    """
+    Делим текст на варианты ответа. Пустые и повторяющиеся варианты отбрасываем,
+    порядок сохраняем. Оставшиеся внутри варианта переносы строк — просто пробелы.
+    """
+    parts = [s or ""]
+    for sep in separators:
+        if not sep:
+            continue
+        parts = [p for chunk in parts for p in chunk.split(sep)]
+    out: List[str] = []
+    for p in parts:
+        p = " ".join(p.split())
+        if p and p not in out:
+            out.append(p)
+    return out
+
+
+def clean_gold(raw: str, separators: Iterable[str] = DEFAULT_SEPARATORS) -> List[str]:
+    """Поле заметки -> список допустимых эталонных ответов."""
+    return split_alternatives(strip_markup(raw), separators)
@@ -7,9 +7,11 @@ from __future__ import annotations
 
 import json
 import os
+import socket
+import threading
 import time
 from math import ceil
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 try:
     from openai import OpenAI
@@ -28,15 +30,24 @@ def _config_path() -> str:
     return os.path.join(here, "config.json")
 
 
+# снимок конфига: перечитываем файл только при смене mtime
+_CFG_SNAPSHOT: Tuple[float, Dict[str, Any]] = (-1.0, {})
+
+
 def load_cfg() -> Dict[str, Any]:
     """
     Читает config.json. Без него работа не продолжается.
+    Возвращает копию снимка — вызывающий код может её менять.
     """
+    global _CFG_SNAPSHOT
     path = _config_path()
     if not os.path.exists(path):
         raise FileNotFoundError(f"config.json not found at {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    mtime = os.path.getmtime(path)
+    if _CFG_SNAPSHOT[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            _CFG_SNAPSHOT = (mtime, json.load(f))
+    return dict(_CFG_SNAPSHOT[1])
 
 
 # =========================
@@ -55,6 +66,17 @@ ALLOWED_CATEGORIES: List[str] = [
 ALLOWED_BUTTONS: List[str] = ["Again", "Hard", "Good", "Easy"]
 
 COMMENT_WORD_LIMIT = 20
+# В компактной схеме комментарий необязателен и короче
+COMPACT_COMMENT_WORD_LIMIT = 12
+
+# Схемы ответа модели
+SCHEMA_FULL = "full"  # set_verdict: имена категории/кнопки + комментарий
+SCHEMA_COMPACT = "compact"  # v: индексы + необязательный комментарий
+SCHEMA_TWO_PHASE = "two_phase"  # v: только индексы; x: объяснение по запросу
+# Замер full vs compact (evaluate.py --stub, 5 примеров; заглушка считает
+# токены как длина аргументов / 4 + 4 и отвечает за 40 мс + 8 мс на токен):
+#   выходных токенов на вердикт 27.5 -> 17.8, латентность p50 278 -> 212 мс.
+# На реальном API: python gpt_client.py --compare "..." "..." [раундов].
 
 
 # =========================
@@ -72,6 +94,8 @@ SYSTEM_PROMPT = (
     "- Easy = fully correct and natural.\n\n"
     "Return the result ONLY via the provided function/schema.\n"
     "If uncertain, choose the closest allowed value; DO NOT invent new labels.\n"
+    'The reference may list several acceptable answers separated by " | "; '
+    "judge against the closest one.\n"
     'Ignore any "[PAD]" tokens in the input; they are only padding and not part of the answer.'
 )
 
@@ -93,7 +117,7 @@ def _trim_comment_words(s: str, max_words: int = COMMENT_WORD_LIMIT) -> str:
     return " ".join(words[:max_words])
 
 
-def _is_valid_verdict(v: Any) -> bool:
+def _is_valid_verdict(v: Any, require_comment: bool = True) -> bool:
     if not isinstance(v, dict):
         return False
     if set(v.keys()) != {"category", "button", "comment"}:
@@ -105,7 +129,7 @@ def _is_valid_verdict(v: Any) -> bool:
     comment = v.get("comment")
     if not isinstance(comment, str):
         return False
-    if len(comment.strip()) == 0:
+    if require_comment and len(comment.strip()) == 0:
         return False
     if len(comment.strip().split()) > COMMENT_WORD_LIMIT:
         return False
@@ -129,10 +153,125 @@ def _safe_verdict_from_arguments(arg_text: str) -> Optional[Dict[str, Any]]:
     return data
 
 
+def _decode_compact(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Компактная схема {'b': idx, 'c': idx, 'm'?: str}
+    -> обычный вердикт {'category','button','comment'}.
+    """
+    if not isinstance(data, dict):
+        return None
+    try:
+        b, c = int(data["b"]), int(data["c"])
+    except Exception:
+        return None
+    if not (0 <= b < len(ALLOWED_BUTTONS) and 0 <= c < len(ALLOWED_CATEGORIES)):
+        return None
+    comment = data.get("m") or ""
+    if not isinstance(comment, str):
+        comment = ""
+    return {
+        "category": ALLOWED_CATEGORIES[c],
+        "button": ALLOWED_BUTTONS[b],
+        "comment": _trim_comment_words(comment, COMPACT_COMMENT_WORD_LIMIT),
+    }
+
+
+def _usage_dict(resp: Any) -> Dict[str, Any]:
+    """usage из ответа SDK в обычный dict (+ закешированные провайдером токены)."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return {}
+    out = {
+        k: getattr(usage, k, None)
+        for k in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is not None:
+        out["cached_tokens"] = cached
+    return out
+
+
+def _add_usage(total: Dict[str, Any], usage: Dict[str, Any]) -> None:
+    for k, v in usage.items():
+        if isinstance(v, int):
+            total[k] = (total.get(k) or 0) + v
+
+
 # ======================
 # Tools (Function Calling)
 # ======================
-def _build_tools() -> List[Dict[str, Any]]:
+def _codes(values: List[str]) -> str:
+    return ", ".join(f"{i}={v}" for i, v in enumerate(values))
+
+
+def _build_tools(schema: str = SCHEMA_FULL) -> List[Dict[str, Any]]:
+    """
+    SCHEMA_COMPACT — короткая схема: индексы вместо имён и необязательный
+    комментарий, чтобы модель генерировала как можно меньше токенов.
+    SCHEMA_TWO_PHASE — обе функции (вердикт без комментария и объяснение)
+    в каждом запросе: tools входят в префикс prompt, и второй запрос
+    попадает в кеш провайдера.
+    """
+    if schema in (SCHEMA_COMPACT, SCHEMA_TWO_PHASE):
+        properties: Dict[str, Any] = {
+            "b": {
+                "type": "integer",
+                "enum": list(range(len(ALLOWED_BUTTONS))),
+                "description": f"Button: {_codes(ALLOWED_BUTTONS)}",
+            },
+            "c": {
+                "type": "integer",
+                "enum": list(range(len(ALLOWED_CATEGORIES))),
+                "description": f"Category: {_codes(ALLOWED_CATEGORIES)}",
+            },
+        }
+        if schema == SCHEMA_COMPACT:
+            properties["m"] = {
+                "type": "string",
+                "description": (
+                    f"Optional short comment in English "
+                    f"(<= {COMPACT_COMMENT_WORD_LIMIT} words); "
+                    "omit when the answer is fully correct."
+                ),
+            }
+        tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": "v",
+                    "description": "Return a strict verdict for Anki grading",
+                    "parameters": {
+                        "type": "object",
+                        "properties": properties,
+                        "required": ["b", "c"],
+                        "additionalProperties": False,
+                    },
+                },
+            }
+        ]
+        if schema == SCHEMA_TWO_PHASE:
+            tools.append(
+                {
+                    "type": "function",
+                    "function": {
+                        "name": "x",
+                        "description": "Explain the given verdict",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "m": {
+                                    "type": "string",
+                                    "description": f"Short explanation in English (<= {COMMENT_WORD_LIMIT} words).",
+                                },
+                            },
+                            "required": ["m"],
+                            "additionalProperties": False,
+                        },
+                    },
+                }
+            )
+        return tools
     return [
         {
             "type": "function",
@@ -157,12 +296,12 @@ def _build_tools() -> List[Dict[str, Any]]:
     ]
 
 
-def _tools_chars() -> int:
+def _tools_chars(schema: str = SCHEMA_FULL) -> int:
     """
     Примерная длина JSON-схемы tools, чтобы учесть её во вводных токенах.
     """
     try:
-        s = json.dumps(_build_tools(), ensure_ascii=False, separators=(",", ":"))
+        s = json.dumps(_build_tools(schema), ensure_ascii=False, separators=(",", ":"))
         return len(s)
     except Exception:
         # запасной вариант
@@ -179,7 +318,12 @@ def _approx_tokens_from_chars(chars: int) -> int:
     return int(ceil(chars / 4.0))
 
 
-def _estimate_prompt_tokens(gold_text: str, user_text: str) -> int:
+def _estimate_prompt_tokens(
+    gold_text: str,
+    user_text: str,
+    schema: str = SCHEMA_FULL,
+    system_prompt: str = SYSTEM_PROMPT,
+) -> int:
     """
     Оцениваем количество токенов во ВСЁМ prompt:
     - system prompt
@@ -187,8 +331,8 @@ def _estimate_prompt_tokens(gold_text: str, user_text: str) -> int:
     - пользовательское сообщение: "Reference (Gold): ...\nUser: ..."
     - небольшая служебная обвязка (roles и т.п.)
     """
-    sys_chars = len(SYSTEM_PROMPT)
-    tools_chars = _tools_chars()
+    sys_chars = len(system_prompt)
+    tools_chars = _tools_chars(schema)
     user_msg = f"Reference (Gold): {gold_text}\nUser: {user_text}"
     user_chars = len(user_msg)
 
@@ -208,13 +352,15 @@ def _apply_padding_if_needed(
     pad_min_tokens: int,
     pad_piece: str,
     pad_margin_tokens: int,
+    schema: str = SCHEMA_FULL,
+    system_prompt: str = SYSTEM_PROMPT,
 ) -> str:
     """
     Если оценка prompt-токенов < pad_min_tokens, добавляем к user_text повтор pad_piece
     в количестве, достаточном чтобы превысить порог (с небольшим запасом pad_margin_tokens).
     Возвращаем (возможно) дополненный user_text.
     """
-    approx_before = _estimate_prompt_tokens(gold_text, user_text)
+    approx_before = _estimate_prompt_tokens(gold_text, user_text, schema, system_prompt)
     if approx_before >= pad_min_tokens:
         return user_text  # уже достаточно
 
@@ -239,25 +385,25 @@ def _apply_padding_if_needed(
 # ======================
 # Основной вызов модели
 # ======================
-def _call_model_function_call(
-    client: OpenAI,
-    model: str,
-    temperature: float,
-    top_p: float,
-    max_tokens: int,
+def _system_prompt(cfg: Dict[str, Any]) -> str:
+    """system_prompt из конфига (для экспериментов), иначе встроенный."""
+    return str(cfg.get("system_prompt") or "").strip() or SYSTEM_PROMPT
+
+
+def _build_messages(
     gold_text: str,
     user_text: str,
     extra_system: Optional[str] = None,
-) -> Dict[str, Any]:
+    system_prompt: str = SYSTEM_PROMPT,
+) -> List[Dict[str, Any]]:
     """
-    Один поход в модель с Function Calling (enum).
-    Возвращает dict {'category','button','comment'} или пустой dict при сбое.
+    system + user. Общий префикс для вердикта и объяснения — совпадает байт в байт,
+    чтобы второй запрос попадал в кеш провайдера.
     """
     system_content = (
-        SYSTEM_PROMPT if not extra_system else f"{SYSTEM_PROMPT}\n\n{extra_system}"
+        system_prompt if not extra_system else f"{system_prompt}\n\n{extra_system}"
     )
-
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {
             "role": "user",
@@ -265,45 +411,285 @@ def _call_model_function_call(
         },
     ]
 
-    tools = _build_tools()
+
+def _call_model_function_call(
+    client: OpenAI,
+    model: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    gold_text: str,
+    user_text: str,
+    extra_system: Optional[str] = None,
+    schema: str = SCHEMA_FULL,
+    system_prompt: str = SYSTEM_PROMPT,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Один поход в модель с Function Calling (enum).
+    Возвращает (вердикт {'category','button','comment'} или пустой dict при сбое, usage).
+    Компактный ответ декодируется здесь же в обычный вердикт.
+    """
+    messages = _build_messages(gold_text, user_text, extra_system, system_prompt)
+
+    tools = _build_tools(schema)
+    tool_name = tools[0]["function"]["name"]
 
     resp = client.chat.completions.create(
         model=model,
         messages=messages,
         tools=tools,
-        tool_choice={"type": "function", "function": {"name": "set_verdict"}},
+        tool_choice={"type": "function", "function": {"name": tool_name}},
         temperature=temperature,
         top_p=top_p,
         max_tokens=max_tokens,
     )
 
+    usage = _usage_dict(resp)
     try:
         msg = resp.choices[0].message
         tool_calls = getattr(msg, "tool_calls", None) or []
         if not tool_calls:
-            return {}
+            return {}, usage
         args_text = tool_calls[0].function.arguments
         parsed = _safe_verdict_from_arguments(args_text)
-        return parsed or {}
+        if schema != SCHEMA_FULL:
+            parsed = _decode_compact(parsed)
+        return parsed or {}, usage
     except Exception:
-        return {}
+        return {}, usage
+
+
+def _call_model_explain(
+    client: OpenAI,
+    model: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    gold_text: str,
+    user_text: str,
+    verdict: Dict[str, Any],
+    system_prompt: str = SYSTEM_PROMPT,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Вторая фаза: объяснение уже выставленного вердикта.
+    Префикс (system, tools, user) тот же, что у первой фазы; отличается только хвост.
+    Возвращает (комментарий или "" при сбое, usage).
+    """
+    messages = _build_messages(gold_text, user_text, system_prompt=system_prompt)
+    messages.append(
+        {
+            "role": "user",
+            "content": (
+                f"Verdict: {verdict.get('button')} "
+                f"(category: {verdict.get('category')}). Explain it briefly."
+            ),
+        }
+    )
+
+    resp = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=_build_tools(SCHEMA_TWO_PHASE),
+        tool_choice={"type": "function", "function": {"name": "x"}},
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+    )
+
+    usage = _usage_dict(resp)
+    try:
+        tool_calls = getattr(resp.choices[0].message, "tool_calls", None) or []
+        if not tool_calls:
+            return "", usage
+        data = _safe_verdict_from_arguments(tool_calls[0].function.arguments) or {}
+        comment = data.get("m")
+        if not isinstance(comment, str):
+            return "", usage
+        return _trim_comment_words(comment, COMMENT_WORD_LIMIT), usage
+    except Exception:
+        return "", usage
 
 
 # ===================================
 # Публичная функция для внешнего кода
 # ===================================
+# тёплые клиенты: пул соединений SDK переживает вызовы
+_CLIENTS: Dict[Tuple[str, str], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _make_client(cfg: Dict[str, Any], api_key: Optional[str] = None) -> OpenAI:
+    """
+    Клиент SDK по конфигу (base_url поддерживается SDK v1.x).
+    Один клиент на (api_key, base_url), чтобы не открывать соединения заново.
+    """
+    if OpenAI is None:
+        raise GPTError(
+            "OpenAI SDK is not available. Install 'openai' package v1.x and set OPENAI_API_KEY."
+        )
+
+    base_url = (cfg.get("base_url") or "").strip() or None
+    config_api_key = (cfg.get("openai_api_key") or "").strip()
+    use_api_key = (
+        api_key or config_api_key or os.getenv("OPENAI_API_KEY") or ""
+    ).strip()
+
+    key = (use_api_key, base_url or "")
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client_kwargs = {}
+            if use_api_key:
+                client_kwargs["api_key"] = use_api_key
+            if base_url:
+                client_kwargs["base_url"] = base_url
+            client = _CLIENTS[key] = OpenAI(**client_kwargs)
+    return client
+
+
+# ======================
+# Тонкий клиент демона
+# ======================
+# после неудачного подключения не пробуем демон какое-то время
+_DAEMON_DOWN_UNTIL = 0.0
+
+# единственные ключи конфига, которые клиент может переопределить через демон:
+# ни base_url, ни openai_api_key — иначе любой клиент отправил бы ключ куда угодно
+DAEMON_OVERRIDE_KEYS = frozenset(
+    {
+        "model",
+        "max_tokens",
+        "button_max_tokens",
+        "temperature",
+        "top_p",
+        "pad_min_tokens",
+        "pad_piece",
+        "pad_margin_tokens",
+        "system_prompt",
+    }
+)
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def daemon_token_path() -> str:
+    """
+    Общий секрет демона: daemon.py пишет его при запуске (права 0600),
+    клиенты отправляют с каждым запросом. Чужие страницы и процессы,
+    достучавшиеся до порта, без него ничего не получат.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(here, "user_files", "daemon.token")
+
+
+def _daemon_token() -> str:
+    try:
+        with open(daemon_token_path(), "r", encoding="utf-8") as f:
+            token = f.read().strip()
+    except OSError as e:
+        raise DaemonUnavailable(f"no daemon token: {e}") from e
+    if not token:
+        raise DaemonUnavailable("empty daemon token")
+    return token
+
+
+def _daemon_request(cfg: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Один запрос к локальному демону (daemon.py): строка JSON туда, строка JSON обратно.
+    DaemonUnavailable — к демону не удалось подключиться (можно считать локально),
+    GPTError — демон принял запрос, но не ответил вовремя или ответил ошибкой.
+    После подключения запрос мог уже уйти в модель, поэтому повторять его
+    локально нельзя — это второй платный вызов.
+    """
+    global _DAEMON_DOWN_UNTIL
+    if time.monotonic() < _DAEMON_DOWN_UNTIL:
+        raise DaemonUnavailable("daemon marked down")
+
+    request = dict(request, token=_daemon_token())
+    host = str(cfg.get("daemon_host", "127.0.0.1"))
+    port = int(cfg.get("daemon_port", 8765))
+    try:
+        sock = socket.create_connection(
+            (host, port), timeout=float(cfg.get("daemon_connect_timeout_sec", 0.2))
+        )
+    except OSError as e:
+        _DAEMON_DOWN_UNTIL = time.monotonic() + float(cfg.get("daemon_retry_sec", 30))
+        raise DaemonUnavailable(str(e)) from e
+
+    buf = b""
+    with sock:
+        try:
+            sock.settimeout(float(cfg.get("daemon_timeout_sec", 30)))
+            sock.sendall(
+                json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n"
+            )
+            while not buf.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                buf += chunk
+        except OSError as e:
+            raise GPTError(f"daemon request failed: {e}") from e
+
+    try:
+        reply = json.loads(buf.decode("utf-8"))
+    except Exception as e:
+        raise GPTError(f"bad reply from daemon: {e}") from e
+    if not reply.get("ok"):
+        raise GPTError(str(reply.get("error") or "daemon error"))
+    return reply["result"]
+
+
+def _padded_user_text(
+    cfg: Dict[str, Any], gold_text: str, user_text: str, schema: str
+) -> str:
+    """
+    ПАДДИНГ: увеличиваем prompt, если он меньше pad_min_tokens.
+    Параметры можно не задавать в конфиге — используются дефолты.
+    """
+    return _apply_padding_if_needed(
+        gold_text=gold_text,
+        user_text=user_text,
+        pad_min_tokens=int(cfg.get("pad_min_tokens", 1024)),
+        pad_piece=str(cfg.get("pad_piece", " [PAD]")),
+        # небольшой запас сверх порога
+        pad_margin_tokens=int(cfg.get("pad_margin_tokens", 64)),
+        schema=schema,
+        system_prompt=_system_prompt(cfg),
+    )
+
+
 def judge_text(
-    user_text: str, gold_text: str, api_key: Optional[str] = None
+    user_text: str,
+    gold_text: str,
+    api_key: Optional[str] = None,
+    compact: Optional[bool] = None,
+    button_only: bool = False,
+    use_daemon: Optional[bool] = None,
+    overrides: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
-    Главная функция: возвращает {'category','button','comment'}.
+    Главная функция: возвращает {'category','button','comment'}
+    + служебные 'usage' (токены всех попыток) и 'latency_ms'.
     Все параметры берутся из config.json:
       - model, temperature, top_p, max_tokens
+      - compact_verdict (компактная схема ответа; аргумент compact переопределяет)
+      - button_max_tokens (лимит для button_only)
       - retries, backoff_ms
       - base_url, openai_api_key (если не передан api_key аргументом)
       - pad_min_tokens (порог для скидки; по умолчанию 1024)
       - pad_piece (что повторяем; по умолчанию " [PAD]")
       - pad_margin_tokens (запас сверх порога; по умолчанию 64)
+    button_only=True — первая фаза двухфазного режима: только кнопка и категория
+    (comment пустой), объяснение потом даёт explain_text с тем же префиксом.
+    use_daemon (по умолчанию из конфига) — сначала спрашиваем локальный демон
+    (тёплый клиент и общий кеш), если он недоступен — считаем в этом процессе.
+    overrides — ключи конфига поверх config.json для этого вызова
+    (model, max_tokens, pad_min_tokens, temperature, system_prompt, ...).
+    Через демон уходят только ключи из DAEMON_OVERRIDE_KEYS, с остальными
+    (например, base_url) вызов выполняется в этом процессе.
     Стратегия:
       - Guard на пустые ответы.
       - Авто-паддинг для достижения минимального размера prompt.
@@ -317,52 +703,60 @@ def judge_text(
         raise ValueError("Gold text is empty.")
 
     cfg = load_cfg()
+    if overrides:
+        cfg.update(overrides)
+
+    if use_daemon is None:
+        use_daemon = bool(cfg.get("use_daemon", True))
+    # прочие переопределения демон не примет — такой вызов считаем сами
+    if use_daemon and set(overrides or {}) <= DAEMON_OVERRIDE_KEYS:
+        try:
+            return _daemon_request(
+                cfg,
+                {
+                    "op": "judge",
+                    "user_text": user_text,
+                    "gold_text": gold_text,
+                    "api_key": api_key,
+                    "compact": compact,
+                    "button_only": button_only,
+                    "overrides": overrides or {},
+                },
+            )
+        except DaemonUnavailable:
+            pass
 
     model = str(cfg.get("model", "gpt-4o-mini"))
     temperature = float(cfg.get("temperature", 0.0))
     top_p = float(cfg.get("top_p", 1.0))
     max_tokens = int(cfg.get("max_tokens", 64))
+    if compact is None:
+        compact = bool(cfg.get("compact_verdict", True))
+    if button_only:
+        schema = SCHEMA_TWO_PHASE
+        max_tokens = int(cfg.get("button_max_tokens", 16))
+    else:
+        schema = SCHEMA_COMPACT if compact else SCHEMA_FULL
 
     retries = int(cfg.get("retries", 1))
     backoff_ms = cfg.get("backoff_ms", [500])  # список миллисекунд
+    system_prompt = _system_prompt(cfg)
 
-    base_url = (cfg.get("base_url") or "").strip() or None
-    config_api_key = (cfg.get("openai_api_key") or "").strip()
-    use_api_key = (
-        api_key or config_api_key or os.getenv("OPENAI_API_KEY") or ""
-    ).strip()
-
-    # Параметры паддинга (можно не задавать в конфиге — используются дефолты)
-    pad_min_tokens = int(cfg.get("pad_min_tokens", 1024))
-    pad_piece = str(cfg.get("pad_piece", " [PAD]"))
-    pad_margin_tokens = int(
-        cfg.get("pad_margin_tokens", 64)
-    )  # небольшой запас сверх порога
+    client = _make_client(cfg, api_key)
+    user_text_for_prompt = _padded_user_text(cfg, gold_text, user_text, schema)
 
-    if OpenAI is None:
-        raise GPTError(
-            "OpenAI SDK is not available. Install 'openai' package v1.x and set OPENAI_API_KEY."
-        )
+    usage: Dict[str, Any] = {}
+    t0 = time.perf_counter()
 
-    # Инициализируем клиента (base_url поддерживается SDK v1.x)
-    client_kwargs = {}
-    if use_api_key:
-        client_kwargs["api_key"] = use_api_key
-    if base_url:
-        client_kwargs["base_url"] = base_url
-    client = OpenAI(**client_kwargs)
-
-    # --- ПАДДИНГ: увеличиваем prompt, если он меньше pad_min_tokens ---
-    user_text_for_prompt = _apply_padding_if_needed(
-        gold_text=gold_text,
-        user_text=user_text,
-        pad_min_tokens=pad_min_tokens,
-        pad_piece=pad_piece,
-        pad_margin_tokens=pad_margin_tokens,
-    )
+    def _done(v: Dict[str, Any]) -> Dict[str, Any]:
+        # служебные поля добавляем только после валидации (она строгая по ключам)
+        out = dict(v)
+        out["usage"] = usage
+        out["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+        return out
 
     # Первая попытка
-    verdict = _call_model_function_call(
+    verdict, u = _call_model_function_call(
         client=client,
         model=model,
         temperature=temperature,
@@ -371,9 +765,12 @@ def judge_text(
         gold_text=gold_text,
         user_text=user_text_for_prompt,
         extra_system=None,
+        schema=schema,
+        system_prompt=system_prompt,
     )
-    if _is_valid_verdict(verdict):
-        return verdict
+    _add_usage(usage, u)
+    if _is_valid_verdict(verdict, require_comment=schema == SCHEMA_FULL):
+        return _done(verdict)
 
     # Ретраи
     attempts = 0
@@ -386,8 +783,10 @@ def judge_text(
         extra_sys = (
             "Your previous output was invalid. "
             "Return ONLY allowed enums and a short comment (<= 20 words)."
+            if schema == SCHEMA_FULL
+            else "Your previous output was invalid. Return ONLY the allowed integer codes."
         )
-        verdict = _call_model_function_call(
+        verdict, u = _call_model_function_call(
             client=client,
             model=model,
             temperature=temperature,
@@ -396,14 +795,80 @@ def judge_text(
             gold_text=gold_text,
             user_text=user_text_for_prompt,  # тот же промпт с паддингом
             extra_system=extra_sys,
+            schema=schema,
+            system_prompt=system_prompt,
         )
-        if _is_valid_verdict(verdict):
-            return verdict
+        _add_usage(usage, u)
+        if _is_valid_verdict(verdict, require_comment=schema == SCHEMA_FULL):
+            return _done(verdict)
 
         attempts += 1
 
     # Если совсем не получилось — честно фейлимся
-    raise ValueError("Model failed to produce a valid verdict after retries.")
+    # (токены неудачных попыток всё равно оплачены — отдаём их вместе с ошибкой)
+    err = ValueError("Model failed to produce a valid verdict after retries.")
+    err.usage = usage  # type: ignore[attr-defined]
+    raise err
+
+
+def explain_text(
+    user_text: str,
+    gold_text: str,
+    verdict: Dict[str, Any],
+    api_key: Optional[str] = None,
+    use_daemon: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Вторая фаза двухфазного режима: объяснение вердикта, полученного
+    judge_text(button_only=True). Тот же prompt (включая паддинг и tools),
+    поэтому префикс попадает в кеш провайдера.
+    Возвращает {'comment', 'usage', 'latency_ms'}; пустой комментарий — ValueError.
+    """
+    cfg = load_cfg()
+
+    if use_daemon is None:
+        use_daemon = bool(cfg.get("use_daemon", True))
+    if use_daemon:
+        try:
+            return _daemon_request(
+                cfg,
+                {
+                    "op": "explain",
+                    "user_text": user_text,
+                    "gold_text": gold_text,
+                    "api_key": api_key,
+                    "verdict": {
+                        k: verdict.get(k) for k in ("category", "button", "comment")
+                    },
+                },
+            )
+        except DaemonUnavailable:
+            pass
+
+    client = _make_client(cfg, api_key)
+    user_text_for_prompt = _padded_user_text(
+        cfg, gold_text, user_text, SCHEMA_TWO_PHASE
+    )
+
+    t0 = time.perf_counter()
+    comment, usage = _call_model_explain(
+        client=client,
+        model=str(cfg.get("model", "gpt-4o-mini")),
+        temperature=float(cfg.get("temperature", 0.0)),
+        top_p=float(cfg.get("top_p", 1.0)),
+        max_tokens=int(cfg.get("max_tokens", 64)),
+        gold_text=gold_text,
+        user_text=user_text_for_prompt,
+        verdict=verdict,
+        system_prompt=_system_prompt(cfg),
+    )
+    if not comment.strip():
+        raise ValueError("Model failed to produce an explanation.")
+    return {
+        "comment": comment,
+        "usage": usage,
+        "latency_ms": int((time.perf_counter() - t0) * 1000),
+    }
 
 
 # ===========
@@ -418,8 +883,49 @@ if __name__ == "__main__":
         except Exception:
             return default
 
+    def _compare(user: str, gold: str, rounds: int) -> None:
+        """Полная схема vs компактная: выходные токены и латентность."""
+        runs: Dict[str, List[Dict[str, Any]]] = {"full": [], "compact": []}
+        for _ in range(max(1, rounds)):
+            # чередуем, чтобы обе схемы попадали в одинаковые условия сети
+            for name in ("full", "compact"):
+                # мимо демона: его кеш исказил бы замер
+                runs[name].append(
+                    judge_text(
+                        user, gold, compact=(name == "compact"), use_daemon=False
+                    )
+                )
+        for name, outs in runs.items():
+            lat = sorted(o["latency_ms"] for o in outs)
+            out_tok = [o["usage"].get("completion_tokens") or 0 for o in outs]
+            print(
+                json.dumps(
+                    {
+                        "schema": name,
+                        "runs": len(outs),
+                        "completion_tokens_avg": round(sum(out_tok) / len(out_tok), 1),
+                        "latency_ms_p50": lat[len(lat) // 2],
+                        "latency_ms_max": lat[-1],
+                        "buttons": [o["button"] for o in outs],
+                    },
+                    ensure_ascii=False,
+                )
+            )
+
     # Пример запуска:
     # python gpt_client.py "user text" "gold text"
+    # python gpt_client.py --compare "user text" "gold text" [раундов=5]
+    if _read_arg(1) == "--compare":
+        try:
+            _compare(
+                _read_arg(2, "").strip(),
+                _read_arg(3, "").strip(),
+                int(_read_arg(4, "5") or 5),
+            )
+        except Exception as e:
+            print(f"ERROR: {e}")
+        sys.exit(0)
+
     user = _read_arg(1, "").strip()
     gold = _read_arg(2, "").strip()
 
@@ -0,0 +1,290 @@
+# local_grader.py
+# Локальный «обучаемый» грейдер: мультиклассовая логистическая регрессия
+# по признакам различий между нормализованными ответом и эталоном.
+# Учится инкрементально (SGD) на вердиктах GPT, которые аддон уже получил,
+# и служит быстрым пред-этапом и запасным грейдером, когда провайдер недоступен.
+# Без внешних зависимостей (в Python Anki нет NumPy): 4 класса × ~12 весов.
+
+from __future__ import annotations
+
+import difflib
+import json
+import math
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+BUTTONS: List[str] = ["Again", "Hard", "Good", "Easy"]
+
+FEATURE_NAMES: List[str] = [
+    "bias",
+    "char_ratio",
+    "word_ratio",
+    "missing_words",
+    "extra_words",
+    "len_diff",
+    "same_wo_punct",
+    "same_wo_articles",
+    "same_words_other_order",
+    "near_miss_words",
+    "diff_blocks",
+    "short_gold",
+]
+
+_word_re = re.compile(r"[^\W_]+(?:['’][^\W_]+)*", re.UNICODE)
+_ARTICLES = {"a", "an", "the"}
+
+# признаки считаются в UI-потоке Anki: посимвольный diff растёт квадратично,
+# поэтому длинные ответы локальный грейдер не оценивает и на них не учится
+MAX_CHARS = 120
+
+
+# =========================
+# Признаки
+# =========================
+def _words(s: str) -> List[str]:
+    return _word_re.findall(s or "")
+
+
+def extract_features(user_norm: str, gold_norm: str) -> List[float]:
+    """
+    Вектор признаков (все значения в [0, 1]) для пары нормализованных строк.
+    Порядок совпадает с FEATURE_NAMES.
+    """
+    uw = _words(user_norm)
+    gw = _words(gold_norm)
+    u_set, g_set = set(uw), set(gw)
+
+    char_ratio = difflib.SequenceMatcher(
+        None, user_norm, gold_norm, autojunk=False
+    ).ratio()
+    wm = difflib.SequenceMatcher(None, uw, gw, autojunk=False)
+    word_ratio = wm.ratio()
+
+    missing = len(g_set - u_set) / len(g_set) if g_set else 0.0
+    extra_list = [w for w in uw if w not in g_set]
+    extra = len(extra_list) / len(uw) if uw else 1.0
+
+    lu, lg = len(user_norm), len(gold_norm)
+    len_diff = abs(lu - lg) / max(lu, lg, 1)
+
+    same_wo_punct = 1.0 if uw == gw and uw else 0.0
+    same_wo_articles = (
+        1.0
+        if [w for w in uw if w not in _ARTICLES]
+        == [w for w in gw if w not in _ARTICLES]
+        and uw != gw
+        else 0.0
+    )
+    same_other_order = 1.0 if sorted(uw) == sorted(gw) and uw != gw else 0.0
+
+    # «почти совпавшие» слова — вероятные опечатки
+    # (кандидаты — только слова эталона, которых нет в ответе)
+    missing_list = [w for w in g_set if w not in u_set]
+    near = 0
+    for w in extra_list:
+        if missing_list and difflib.get_close_matches(w, missing_list, n=1, cutoff=0.8):
+            near += 1
+    near_miss = near / len(uw) if uw else 0.0
+
+    blocks = sum(1 for op in wm.get_opcodes() if op[0] != "equal")
+    diff_blocks = min(1.0, blocks / 5.0)
+
+    short_gold = 1.0 if len(gw) <= 3 else 0.0
+
+    return [
+        1.0,
+        char_ratio,
+        word_ratio,
+        missing,
+        extra,
+        len_diff,
+        same_wo_punct,
+        same_wo_articles,
+        same_other_order,
+        near_miss,
+        diff_blocks,
+        short_gold,
+    ]
+
+
+def _softmax(z: List[float]) -> List[float]:
+    m = max(z)
+    e = [math.exp(x - m) for x in z]
+    s = sum(e)
+    return [x / s for x in e]
+
+
+# =========================
+# Модель
+# =========================
+class LocalGrader:
+    """
+    Мультиклассовая логистическая регрессия с онлайн-обучением.
+    confidence — сырой softmax без отдельного шага калибровки. Вместо неё
+    доверие решает измеренная точность: для каждого нового вердикта GPT
+    сначала делаем прогноз и в скользящем окне считаем, насколько часто
+    уверенные прогнозы совпадали с GPT. Чтобы окно не застывало, когда
+    уверенные случаи отвечаются локально, часть из них всё равно уходит
+    в GPT (audit_due).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        lr: float = 0.5,
+        l2: float = 1e-4,
+        window: int = 200,
+        save_every: int = 20,
+        max_chars: int = MAX_CHARS,
+    ) -> None:
+        self.path = path
+        self.lr = lr
+        self.l2 = l2
+        self.save_every = save_every
+        self.max_chars = max_chars
+        self.n_features = len(FEATURE_NAMES)
+        self.weights: List[List[float]] = [[0.0] * self.n_features for _ in BUTTONS]
+        self.samples = 0
+        # (уверенность прогноза, совпал ли с GPT)
+        self.history: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._dirty = 0
+        self._trusted_seen = 0
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    # ---------- прогноз ----------
+    def _proba(self, x: List[float]) -> List[float]:
+        z = [sum(w * v for w, v in zip(row, x)) for row in self.weights]
+        return _softmax(z)
+
+    def predict(self, user_norm: str, gold_norm: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает {'button','confidence','probs'} или None, если модель ещё
+        не обучалась или пара длиннее max_chars.
+        """
+        if self.samples <= 0 or not self.accepts(user_norm, gold_norm):
+            return None
+        x = extract_features(user_norm, gold_norm)
+        with self._lock:
+            p = self._proba(x)
+        i = max(range(len(p)), key=p.__getitem__)
+        return {
+            "button": BUTTONS[i],
+            "confidence": p[i],
+            "probs": dict(zip(BUTTONS, p)),
+        }
+
+    def accepts(self, user_norm: str, gold_norm: str) -> bool:
+        """Достаточно ли коротка пара, чтобы признаки считались за доли миллисекунды."""
+        return len(user_norm) <= self.max_chars and len(gold_norm) <= self.max_chars
+
+    def precision_at(self, min_confidence: float) -> Tuple[float, int]:
+        """
+        Доля совпадений с GPT среди прогнозов с уверенностью >= min_confidence
+        (по скользящему окну) и число таких прогнозов.
+        """
+        with self._lock:
+            hits = [ok for conf, ok in self.history if conf >= min_confidence]
+        if not hits:
+            return 0.0, 0
+        return sum(hits) / len(hits), len(hits)
+
+    def is_trusted(
+        self,
+        pred: Optional[Dict[str, Any]],
+        min_confidence: float,
+        min_samples: int,
+        min_precision: float,
+    ) -> bool:
+        """
+        Можно ли ответить локально без GPT: модель достаточно обучена,
+        прогноз уверенный, и уверенные прогнозы недавно совпадали с GPT.
+        """
+        if not pred or self.samples < min_samples:
+            return False
+        if pred["confidence"] < min_confidence:
+            return False
+        precision, n = self.precision_at(min_confidence)
+        return n >= 20 and precision >= min_precision
+
+    def audit_due(self, every: int) -> bool:
+        """
+        Вызывается для каждого прогноза, прошедшего is_trusted. Каждый every-й
+        такой случай нужно проверить у GPT: его вердикт через learn() попадёт
+        в окно точности, и дрейф или испорченная модель снимут доверие.
+        every <= 0 — без проверок.
+        """
+        if every <= 0:
+            return False
+        with self._lock:
+            self._trusted_seen += 1
+            return self._trusted_seen % every == 0
+
+    # ---------- обучение ----------
+    def learn(self, user_norm: str, gold_norm: str, button: str) -> None:
+        """Один шаг SGD по вердикту GPT. Безопасно вызывать из фонового потока."""
+        if button not in BUTTONS or not self.accepts(user_norm, gold_norm):
+            return
+        y = BUTTONS.index(button)
+        x = extract_features(user_norm, gold_norm)
+        with self._lock:
+            p = self._proba(x)
+            if self.samples > 0:
+                top = max(range(len(p)), key=p.__getitem__)
+                self.history.append((p[top], top == y))
+            # затухающий шаг обучения
+            step = self.lr / math.sqrt(1.0 + self.samples / 50.0)
+            for k, row in enumerate(self.weights):
+                g = p[k] - (1.0 if k == y else 0.0)
+                for j in range(self.n_features):
+                    row[j] -= step * (g * x[j] + self.l2 * row[j])
+            self.samples += 1
+            self._dirty += 1
+            need_save = self._dirty >= self.save_every
+        if need_save:
+            self.save()
+
+    # ---------- хранение ----------
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        # при смене набора признаков старые веса не годятся
+        if data.get("features") != FEATURE_NAMES:
+            return
+        with self._lock:
+            self.weights = [
+                list(map(float, row)) for row in data.get("weights", self.weights)
+            ]
+            self.samples = int(data.get("samples", 0))
+            self.history.clear()
+            for conf, ok in data.get("history", []):
+                self.history.append((float(conf), bool(ok)))
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "features": FEATURE_NAMES,
+                "weights": [list(row) for row in self.weights],
+                "samples": self.samples,
+                "history": [[conf, ok] for conf, ok in self.history],
+            }
+            self._dirty = 0
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
@@ -7,6 +7,9 @@ DEFAULT_CFG = {
     "auto_answer": False,
     # Поля заметки (оставили только эталон)
     "fields": {"etalon_field": "Back"},
+    # Разделители нескольких допустимых ответов в поле эталона
+    # ("\n" — по желанию: тогда делят и переносы строк, <br>, <div>)
+    "gold_separators": ["|"],
     # Кеш ответов (сек) (0 = отключить)
     "cache_ttl_sec": 600,
     # Лимиты длины для ввода и эталона
@@ -19,6 +22,37 @@ DEFAULT_CFG = {
     # Параметры генерации модели
     "temperature": 0.0,
     "max_tokens": 64,
+    # Компактная схема ответа: индексы кнопки/категории, комментарий необязателен
+    "compact_verdict": True,
+    # Двухфазный режим: сначала только кнопка (button_max_tokens),
+    # объяснение — по клику на панель GPT или сразу для кнопок из explain_auto_buttons
+    "two_phase": False,
+    "button_max_tokens": 16,
+    "explain_auto_buttons": ["Again", "Hard"],
+    # Локальный демон (daemon.py): если запущен, грейдинг идёт через него
+    "use_daemon": True,
+    "daemon_host": "127.0.0.1",
+    "daemon_port": 8765,
+    # Потоки демона для вызовов SDK
+    "daemon_workers": 8,
+    # Таймауты клиента демона: подключение, ответ, пауза после неудачного подключения
+    "daemon_connect_timeout_sec": 0.2,
+    "daemon_timeout_sec": 30,
+    "daemon_retry_sec": 30,
+    # Пул грейдинга: потоки общего назначения (+2 всегда зарезервированы
+    # под карточку на экране) и предел очереди каждой полосы
+    "grader_workers": 2,
+    "grader_queue_max": 64,
+    # Снимок метрик пула (глубина, ожидание по полосам) в лог карточки
+    # раз в N ответов GPT (0 — никогда)
+    "grader_stats_every": 20,
+    # Локальный грейдер (учится на вердиктах GPT)
+    "local_grader": True,
+    "local_grader_min_samples": 200,
+    "local_grader_min_confidence": 0.9,
+    "local_grader_min_precision": 0.95,
+    # каждый N-й уверенный локальный случай всё равно проверяем у GPT (0 — никогда)
+    "local_grader_audit_every": 10,
 }
 
 